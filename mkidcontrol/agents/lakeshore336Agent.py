@@ -86,8 +86,7 @@ def initializer(device):
 
 def callback(tvals, svals):
     vals = tvals + svals
-    keys = TEMP_KEYS + SENSOR_VALUE_KEYS
-    d = {k: x for k, x in zip(keys, vals)}
+    d = dict(zip(TS_KEYS, vals))
     try:
         if all(i is None for i in vals):
             redis.store({STATUS_KEY: "Error"})
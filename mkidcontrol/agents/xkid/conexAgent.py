@@ -18,6 +18,7 @@ import json
 import numpy as np
 import time
 import threading
+from collections import deque
 from serial import SerialException
 from datetime import datetime
 
@@ -31,7 +32,6 @@ from mkidcontrol.devices import Conex
 from mkidcontrol.agents.xkid.observingAgent import OBSERVING_EVENT_KEY
 
 
-logging.basicConfig(level=logging.DEBUG)
 log = logging.getLogger("conexAgent")
 
 QUERY_INTERVAL = 1
@@ -60,10 +60,14 @@ PIXEL_REF_Y_KEY = "instrument:pixel-ref-y"
 OBSERVING_REQUEST_CHANNEL = 'command:observation:request'
 OBSERVING_KEYS = (OBSERVING_REQUEST_CHANNEL, OBSERVING_EVENT_KEY)
 
-CONEX_COMMANDS = tuple([MOVE_COMMAND_KEY, DITHER_COMMAND_KEY, STOP_COMMAND_KEY])
+CONEX_COMMANDS = (MOVE_COMMAND_KEY, DITHER_COMMAND_KEY, STOP_COMMAND_KEY)
 
 SETTING_KEYS = tuple(COMMANDSCONEX.keys())
-COMMAND_KEYS = tuple([f"command:{key}" for key in list(SETTING_KEYS) + list(CONEX_COMMANDS)]) + OBSERVING_KEYS
+COMMAND_KEYS = tuple(f"command:{key}" for key in SETTING_KEYS + CONEX_COMMANDS) + OBSERVING_KEYS
+
+# Sub-dither offsets (in units of the sub-step) visited around each dither point: left, up, right, down
+SUB_DITHER_DX = np.array([-1, 0, 1, 0], dtype=float)
+SUB_DITHER_DY = np.array([0, 1, 0, -1], dtype=float)
 
 DATA_PATH_DIR_KEY = "paths:data-dir"
 DITHER_LOG_KEY = "paths:logs-folder-name"
@@ -87,8 +91,9 @@ class ConexController:
 
     def __init__(self, port, redis=None):
         self.conex = Conex(port=port)
-        self._completed_dithers = []  # list of completed dithers
+        self._completed_dithers = deque()  # queue of completed dithers
         self._movement_thread = None  # thread for moving/dithering
+        self._stop_event = threading.Event()  # set when a dither is stopped or errors, backs self._halt_dither
         self._halt_dither = True
         self._rlock = threading.RLock()
         self._startedMove = 0  # number of times start_move was called (not dither). Reset in queryMove and start_dither
@@ -104,6 +109,17 @@ class ConexController:
             pass
         self.cur_status = self.status()
 
+    @property
+    def _halt_dither(self):
+        return self._stop_event.is_set()
+
+    @_halt_dither.setter
+    def _halt_dither(self, halt):
+        if halt:
+            self._stop_event.set()
+        else:
+            self._stop_event.clear()
+
     def _updateState(self, newState):
         with self._rlock:
             self.state = (self.state[1], newState)
@@ -228,7 +244,7 @@ class ConexController:
         if len(self._completed_dithers) > 0:  # Reading is thread safe
             with self._rlock:  # only lock if at least one dither completed
                 try:
-                    dith = self._completed_dithers.pop(0)
+                    dith = self._completed_dithers.popleft()
                     completed = True
                 except IndexError:
                     pass
@@ -326,16 +342,19 @@ class ConexController:
 
             # do sub dither if neccessary
             if subDither:
-                x_sub = [-dither_dict['subStep'], 0, dither_dict['subStep'], 0]
-                y_sub = [0, dither_dict['subStep'], 0, -dither_dict['subStep']]
-                for i in range(len(x_sub)):
-                    if self.conex.in_bounds((p[0] + x_sub[i], p[1] + y_sub[i])):
-                        startTime, endTime = self._dither_move(p[0] + x_sub[i], p[1] + y_sub[i], dither_dict['subT'])
-                        if startTime is not None:
-                            x_locs.append(json.loads(self.cur_status)['pos'][0])
-                            y_locs.append(json.loads(self.cur_status)['pos'][1])
-                            startTimes.append(startTime)
-                            endTimes.append(endTime)
+                x_sub = p[0] + dither_dict['subStep'] * SUB_DITHER_DX
+                y_sub = p[1] + dither_dict['subStep'] * SUB_DITHER_DY
+                # N.B. Conex positions are (v, u) so x is checked against the v limits and y against the u limits
+                limits = self.conex.limits
+                in_bounds = ((limits['vmin'] <= x_sub) & (x_sub <= limits['vmax']) &
+                             (limits['umin'] <= y_sub) & (y_sub <= limits['umax']))
+                for x, y in zip(x_sub[in_bounds], y_sub[in_bounds]):
+                    startTime, endTime = self._dither_move(x, y, dither_dict['subT'], dither_dict['name'], i, len_dith)
+                    if startTime is not None:
+                        x_locs.append(json.loads(self.cur_status)['pos'][0])
+                        y_locs.append(json.loads(self.cur_status)['pos'][1])
+                        startTimes.append(startTime)
+                        endTimes.append(endTime)
                     if self._halt_dither: break
             if self._halt_dither: break
 
@@ -367,7 +386,6 @@ class ConexController:
                 "error: ..." - If there there was an error during the move
                 "processing" - If everything worked
         """
-        polltime = 0.1  # wait for dwell time but have to check if stop was pressed periodically
         self.move(x, y)
         time.sleep(0.25)
         if self._halt_dither: return None, None  # Stopped or error during move
@@ -379,15 +397,13 @@ class ConexController:
                        'duration': t, 'start': startTime}
         self.redis.publish("command:observation-request", json.dumps(obs_dict), store=False)
         dwell_until = startTime + t
-        endTime = datetime.utcnow().timestamp()
 
         with self._rlock:
             self._update_cur_status(self.status())
-        while self._halt_dither == False and endTime < dwell_until:
-            # TODO CHECK FOR "OBSERVATION STOPPED"
-            sleep = min(polltime, dwell_until - endTime)
-            time.sleep(max(sleep, 0))
-            endTime = datetime.utcnow().timestamp()
+        # TODO CHECK FOR "OBSERVATION STOPPED"
+        # Dwell, returning early if the dither is stopped or errors
+        self._stop_event.wait(timeout=max(dwell_until - datetime.utcnow().timestamp(), 0))
+        endTime = datetime.utcnow().timestamp()
         time.sleep(1) # NB Give the observing agent extra time so that you don't start moving before the dwell step ends
         return startTime, endTime
 
@@ -452,6 +468,20 @@ class ConexController:
         getLogger('dither').info(msg)
 
 
+_last_stored = {}
+
+
+def store_changed(data):
+    """
+    Store the key:value pairs in data that differ from what this agent last stored, saving redis round trips when the
+    same setting or status is written repeatedly
+    """
+    changed = {k: v for k, v in data.items() if _last_stored.get(k) != v}
+    if changed:
+        redis.store(changed)
+        _last_stored.update(changed)
+
+
 def dither_two_point_positions(start_x, start_y, stop_x, stop_y, user_n_steps, single_pixel_move=0.015):
     if user_n_steps == 1:
         log.error('Number of steps must be greater than one!')
@@ -476,24 +506,21 @@ def dither_two_point_positions(start_x, start_y, stop_x, stop_y, user_n_steps, s
     offset_y = np.round(y_list + (interval_y / 2 + 0.5 * single_pixel_move), 3)
     x_grid = np.round(np.sort(np.concatenate((x_list, offset_x[offset_x <= round(stop_x, 4)]))), 3)
     y_grid = np.round(np.sort(np.concatenate((y_list, offset_y[offset_y <= round(stop_y, 4)]))), 3)
-    cycle = 1
 
     if not (np.all(x_grid == 0) or np.all(y_grid == 0)):
         points.append((start_x, start_y))
 
-    while cycle <= n_steps:
-        for i in range(cycle + 1):
-            rev = cycle - i
-            points.append((x_grid[i], y_grid[rev]))
-        cycle += 1
-    cycle = 1
-    second_points = []
-    while cycle <= (n_steps - 1):
-        for i in range(cycle + 1):
-            rev = cycle - i
-            second_points.insert(0, (x_grid[-1 - i], y_grid[-1 - rev]))
-        cycle += 1
-    points = points + second_points
+    # Walk the anti-diagonals (i + rev == cycle) of the grid, first from the start corner for cycle = 1..n_steps, then
+    # from the stop corner for cycle = 1..n_steps-1 which is traversed in reverse so the path ends at the stop corner
+    cycle, i = np.tril_indices(n_steps + 1)
+    cycle, i = cycle[cycle > 0], i[cycle > 0]
+    first_points = np.stack((x_grid[i], y_grid[cycle - i]), axis=1)
+
+    cycle, i = np.tril_indices(n_steps)
+    cycle, i = cycle[cycle > 0], i[cycle > 0]
+    second_points = np.stack((x_grid[-1 - i], y_grid[-1 - (cycle - i)]), axis=1)[::-1]
+
+    points += list(map(tuple, first_points)) + list(map(tuple, second_points))
     if not (np.all(x_grid == 0) or np.all(y_grid == 0)):
         points.append((x_grid[-1], y_grid[-1]))
     return points
@@ -513,15 +540,13 @@ if __name__ == "__main__":
 
     try:
         cc = ConexController(port='/dev/conex', redis=redis)
-        redis.store({SN_KEY: cc.conex.id_number})
-        redis.store({FIRMWARE_KEY: cc.conex.firmware})
-        redis.store({STATUS_KEY: "OK"})
+        store_changed({SN_KEY: cc.conex.id_number, FIRMWARE_KEY: cc.conex.firmware, STATUS_KEY: "OK"})
     except RedisError as e:
         log.error(f"Redis server error! {e}")
         sys.exit(1)
     except Exception as e:
         log.critical(f"Could not connect to the conex! Error {e}")
-        redis.store({STATUS_KEY: f"Error: {e}"})
+        store_changed({STATUS_KEY: f"Error: {e}"})
         sys.exit(1)
 
     # N.B. Conex movement/dither commands will be dicts turned into strings via json.dumps() for convenient sending and
@@ -552,27 +577,27 @@ if __name__ == "__main__":
                                 log.debug("Disabling Conex")
                                 cc.conex.disable()
                                 log.info("Conex disabled")
-                            redis.store({cmd.setting: cmd.value})
-                            redis.store({STATUS_KEY: "OK"})
+                            store_changed({cmd.setting: cmd.value})
+                            store_changed({STATUS_KEY: "OK"})
                     elif key == MOVE_COMMAND_KEY:
                         log.debug(f"Starting conex move...")
                         val = json.loads(val)
                         cc.do_go_to(val['x'], val['y'])
-                        redis.store({STATUS_KEY: "OK"})
+                        store_changed({STATUS_KEY: "OK"})
                         log.info(f"Conex move to ({val['x']}, {val['y']}) successful")
                     elif key == DITHER_COMMAND_KEY:
                         log.debug(f"Starting dither...")
                         val = json.loads(val)
                         cc.do_dither(val)
-                        redis.store({STATUS_KEY: "OK"})
+                        store_changed({STATUS_KEY: "OK"})
                         log.info(f"Started dither with params: {val}")
                     elif key == STOP_COMMAND_KEY or key == OBSERVING_REQUEST_CHANNEL and val['type'] == "abort":
                         log.debug("Stopping conex")
                         cc.do_halt()
-                        redis.store({STATUS_KEY: "OK"})
+                        store_changed({STATUS_KEY: "OK"})
                         log.info("Conex stopped!")
                 except IOError as e:
-                    redis.store({STATUS_KEY: f"Error {e}"})
+                    store_changed({STATUS_KEY: f"Error {e}"})
                     log.error(f"Comm error: {e}")
     except RedisError as e:
         log.error(f"Redis server error! {e}")
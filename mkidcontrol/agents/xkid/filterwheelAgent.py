@@ -8,7 +8,9 @@ TODO: Consider not reinitializing to 'closed' if that is the last known position
 """
 
 import logging
+import random
 import sys
+import time
 
 import mkidcontrol.mkidredis as redis
 import mkidcontrol.util as util
@@ -16,17 +18,18 @@ from mkidcontrol.mkidredis import RedisError
 from mkidcontrol.devices import FilterWheel
 from mkidcontrol.commands import COMMANDSFILTERWHEEL, LakeShoreCommand, FILTERS
 
-logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("filterwheelAgent")
 
-QUERY_INTERVAL = 1
+REDIS_BACKOFF = 0.25  # Initial wait (s) before resubscribing after a redis error, doubles with each failed attempt
+REDIS_MAX_BACKOFF = 16
 
 STATUS_KEY = "status:device:filterwheel:status"
 SN_KEY = "status:device:filterwheel:sn"
 MODEL_KEY = "status:device:filterwheel:model"
 
 SETTING_KEYS = tuple(COMMANDSFILTERWHEEL.keys())
-COMMAND_KEYS = (f"command:{key}" for key in SETTING_KEYS)
+COMMAND_KEYS = tuple(f"command:{key}" for key in SETTING_KEYS)
+COMMAND_SETTINGS = dict(zip(COMMAND_KEYS, SETTING_KEYS))  # command key -> setting key
 
 FILTERWHEEL_CURRENT_POSITION_KEY = 'status:device:filterwheel:position'
 FILTERWHEEL_CURRENT_FILTER_KEY = 'status:device:filterwheel:filter'
@@ -35,6 +38,30 @@ FILTERWHEEL_POSITION_KEY = 'device-settings:filterwheel:position'
 FILTERWHEEL_FILTER_KEY = 'device-settings:filterwheel:filter'
 
 
+def move_to_position(fw, cmd):
+    """
+    Move the filter wheel to the position in cmd, returns the redis keys to update with the resulting position.
+    The move (and the serial round trip) is skipped if the wheel was last known to be in position
+    """
+    position = int(cmd.command_value)
+    if fw.last_position == position:
+        current_pos = position
+    else:
+        fw.set_filter_pos(position)
+        current_pos = fw.get_filter_pos()
+    current_filter = FILTERS[current_pos]
+
+    return {FILTERWHEEL_CURRENT_POSITION_KEY: current_pos,
+            FILTERWHEEL_CURRENT_FILTER_KEY: current_filter,
+            cmd.setting: current_pos,
+            FILTERWHEEL_FILTER_KEY: current_filter,
+            STATUS_KEY: "OK"}
+
+
+# Setting key -> function(fw, cmd) which carries out the command and returns the redis keys to update
+COMMAND_HANDLERS = {FILTERWHEEL_POSITION_KEY: move_to_position}
+
+
 if __name__ == "__main__":
 
     redis.setup_redis()
@@ -42,9 +69,7 @@ if __name__ == "__main__":
 
     try:
         fw = FilterWheel('filterwheel', b'/dev/filterwheel', filters=FILTERS)
-        redis.store({MODEL_KEY: fw.model})
-        redis.store({SN_KEY: fw.serial_number})
-        redis.store({STATUS_KEY: "OK"})
+        redis.store({MODEL_KEY: fw.model, SN_KEY: fw.serial_number, STATUS_KEY: "OK"})
     except RedisError as e:
         log.error(f"Redis server error! {e}")
         sys.exit(1)
@@ -53,33 +78,30 @@ if __name__ == "__main__":
         redis.store({STATUS_KEY: f"Error: {e}"})
         sys.exit(1)
 
-    try:
-        while True:
+    retries = 0
+    while True:
+        try:
             for key, val in redis.listen(COMMAND_KEYS):
-                log.debug(f"filterwheelAgent received {key}: {val}.")
-                key = key.removeprefix("command:")
-                if key in SETTING_KEYS:
+                retries = 0
+                log.debug("filterwheelAgent received %s: %s.", key, val)
+                key = COMMAND_SETTINGS.get(key)
+                if key is not None:
                     try:
                         cmd = LakeShoreCommand(key, val)
                     except ValueError as e:
                         log.warning(f"Ignoring invalid command ('{key}={val}'): {e}")
                         continue
                     try:
-                        log.info(f"Processing command {cmd}")
-                        if key == FILTERWHEEL_POSITION_KEY:
-                            fw.set_filter_pos(int(cmd.command_value))
-
-                            current_pos = fw.get_filter_pos()
-
-                            redis.store({FILTERWHEEL_CURRENT_POSITION_KEY: current_pos,
-                                         FILTERWHEEL_CURRENT_FILTER_KEY: FILTERS[current_pos],
-                                         cmd.setting: current_pos,
-                                         FILTERWHEEL_FILTER_KEY: FILTERS[current_pos],
-                                         STATUS_KEY: "OK"})
+                        log.info("Processing command %s", cmd)
+                        handler = COMMAND_HANDLERS.get(key)
+                        if handler is not None:
+                            redis.store(handler(fw, cmd))
                     except IOError as e:
                         redis.store({STATUS_KEY: f"Error {e}"})
                         log.error(f"Comm error: {e}")
-    except RedisError as e:
-        log.error(f"Redis server error! {e}")
-        sys.exit(1)
-
+        except RedisError as e:
+            # Back off exponentially (with jitter) while redis is unavailable, logging only when the outage starts
+            if retries == 0:
+                log.error(f"Redis server error! {e}. Retrying...")
+            time.sleep(min(REDIS_MAX_BACKOFF, REDIS_BACKOFF * 2 ** retries) + random.uniform(0, REDIS_BACKOFF))
+            retries = min(retries + 1, 16)
@@ -15,8 +15,15 @@ MTS50/M-Z8 NOTES:
     - The device can move from 0 - 1727750 (in encoder step space) or 0 - 50 (in mm space)
 """
 
+import atexit
+import functools
 import logging
+import logging.handlers
+import os
+import queue
 import sys
+import threading
+import time
 
 from mkidcontrol.mkidredis import RedisError
 import mkidcontrol.mkidredis as redis
@@ -59,11 +66,9 @@ DEFAULT_PARAMS = {'home': [[{'home_dir': 2,
   'dest': 0,
   'chan_ident': 1}}
 
-logging.basicConfig(level=logging.DEBUG)
 log = logging.getLogger("focusAgent")
-from logging import getLogger
-l = getLogger('thorlabs_apt_device')
-l.setLevel("DEBUG")
+# The thorlabs library logs every message it sends at DEBUG, so only turn that on when asked to
+logging.getLogger('thorlabs_apt_device').setLevel(os.environ.get('FOCUSAGENT_LOG_LEVEL', 'INFO').upper())
 
 QUERY_INTERVAL = 1
 
@@ -75,6 +80,7 @@ FOCUS_POSITION_MM_KEY = 'status:device:focus:position-mm'
 FOCUS_POSITION_ENCODER_KEY = 'status:device:focus:position-encoder'
 
 TS_KEYS = (FOCUS_POSITION_MM_KEY, FOCUS_POSITION_ENCODER_KEY)
+TS_RETENTION_MS = 30 * 24 * 60 * 60 * 1000  # Keep a month of position history
 
 MOVE_BY_MM_KEY = 'device-settings:focus:desired-move:mm'
 MOVE_BY_ENC_KEY = 'device-settings:focus:desired-move:encoder'
@@ -84,68 +90,139 @@ HOME_KEY = 'device-settings:focus:home'
 JOG_KEY = 'device-settings:focus:jog'
 
 SETTING_KEYS = tuple(COMMANDSFOCUS.keys())
-COMMAND_KEYS = tuple([f"command:{key}" for key in list(SETTING_KEYS) + [MOVE_BY_MM_KEY, MOVE_BY_ENC_KEY, JOG_KEY,
-                                                                        HOME_KEY, MOVE_TO_MM_KEY, MOVE_TO_ENC_KEY]])
+COMMAND_KEYS = tuple(f"command:{key}" for key in SETTING_KEYS + (MOVE_BY_MM_KEY, MOVE_BY_ENC_KEY, JOG_KEY, HOME_KEY,
+                                                                  MOVE_TO_MM_KEY, MOVE_TO_ENC_KEY))
+PARAM_KEYS = frozenset(key for key in SETTING_KEYS if '-params:' in key)
+
+# Pending absolute move (dest, units), only the most recently requested target is kept
+move_target = queue.Queue(maxsize=1)
+
+
+def queue_move(dest, units):
+    """ Replace any pending absolute move with a move to dest """
+    try:
+        move_target.get_nowait()
+    except queue.Empty:
+        pass
+    move_target.put_nowait((dest, units))
+
+
+def move_worker(f):
+    """ Carry out queued absolute moves, waiting for each to finish before starting the next """
+    while True:
+        dest, units = move_target.get()
+        try:
+            f.move_to(dest, units=units)
+        except IOError as e:
+            store_status(f"Error {e}")
+            log.error(f"Comm error: {e}")
+            continue
+        except ValueError as e:
+            log.warning(f"Unable to move to {dest} {units}: {e}")
+            continue
+        time.sleep(f.MOTION_POLL_INTERVAL)
+        while f.moving:
+            time.sleep(f.MOTION_POLL_INTERVAL)
+
+
+# Command key -> function(f, val) which carries out the command on the focus slider
+COMMAND_HANDLERS = {MOVE_TO_MM_KEY: lambda f, val: queue_move(val, 'mm'),
+                    MOVE_TO_ENC_KEY: lambda f, val: queue_move(val, 'encoder'),
+                    MOVE_BY_MM_KEY: lambda f, val: f.move_by(val, units='mm'),
+                    MOVE_BY_ENC_KEY: lambda f, val: f.move_by(val, units='encoder'),
+                    JOG_KEY: lambda f, val: f.jog(direction=val),
+                    HOME_KEY: lambda f, val: f.home_slider()}
+
+
+_last_status = None
+
+
+@functools.lru_cache(maxsize=256)
+def make_command(key, val):
+    """ Build (and vet) the command for key=val, repeated commands reuse the already vetted instance """
+    return LakeShoreCommand(key, val)
+
+
+def store_status(status):
+    """ Store (and publish) the focus status, skipping the write when it is unchanged since the last one """
+    global _last_status
+    if status != _last_status:
+        redis.store({STATUS_KEY: status})
+        _last_status = status
+
 
 def callback(pos):
-    vals = [pos['mm'], pos['encoder']]
-    keys = [FOCUS_POSITION_MM_KEY, FOCUS_POSITION_ENCODER_KEY]
-    d = {k: x for k, x in zip(keys, vals)}
     try:
-        if all(i is None for i in vals):
-            redis.store({STATUS_KEY: "Error"})
+        if pos is None:
+            store_status("Error")
         else:
-            redis.store(d, timeseries=True)
-            redis.store({STATUS_KEY: "OK"})
+            redis.store({FOCUS_POSITION_MM_KEY: pos['mm'], FOCUS_POSITION_ENCODER_KEY: pos['encoder']},
+                        timeseries=True)
+            store_status("OK")
     except RedisError:
-        log.warning('Storing filter wheel data to redis failed!')
+        log.warning('Storing focus position data to redis failed!')
+
+
+def queue_logging(*names):
+    """
+    Swap the handlers of the named loggers for a QueueHandler so records are formatted and written by a listener
+    thread, rather than on the thorlabs serial and monitor threads that emit them
+    """
+    records = queue.SimpleQueue()
+    handlers = []
+    for name in names:
+        logger = logging.getLogger(name)
+        handlers.extend(h for h in logger.handlers if h not in handlers)
+        logger.handlers = [logging.handlers.QueueHandler(records)]
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # Drain anything still queued on a normal exit
+    return listener
 
 
 if __name__ == "__main__":
-    redis.setup_redis(ts_keys=TS_KEYS)
+    redis.setup_redis(ts_keys=dict.fromkeys(TS_KEYS, TS_RETENTION_MS))
     util.setup_logging('focusAgent')
+    queue_logging('', '__main__')
 
     try:
         f = Focus(name='focus', port='/dev/focus')
-        redis.store({STATUS_KEY: "OK"})
+        store_status("OK")
     except RedisError as e:
         log.error(f"Redis server error! {e}")
         sys.exit(1)
     except Exception as e:
         log.critical(f"Could not connect to the filter wheel! Error {e}")
-        redis.store({STATUS_KEY: f"Error: {e}"})
+        store_status(f"Error: {e}")
         sys.exit(1)
 
     f.monitor(QUERY_INTERVAL, (f.position, ), value_callback=callback)
+    threading.Thread(target=move_worker, args=(f,), name='Move Thread', daemon=True).start()
 
     try:
         while True:
             for key, val in redis.listen(COMMAND_KEYS):
                 key = key.removeprefix('command:')
-                log.debug(f"focusAgent received {key} -> {val}!")
+                log.debug("focusAgent received %s -> %s!", key, val)
                 try:
-                    cmd = LakeShoreCommand(key, val)
+                    cmd = make_command(key, val)
                 except ValueError as e:
                     log.warning(f"Ignoring invalid command ('{key}={val}'): {e}")
                     pass
                 try:
-                    if 'params' in key:
+                    if key in PARAM_KEYS:
                         f.update_param(key, val)
                         redis.store({cmd.setting: cmd.value})
-                        redis.store({STATUS_KEY: "OK"})
-                    elif 'desired-position' in key:
-                        units = key.split(":")[-1]
-                        f.move_to(val, units=units)
-                    elif key in [MOVE_BY_MM_KEY, MOVE_BY_ENC_KEY]:
-                        units = key.split(":")[-1]
-                        f.move_by(val, units=units)
-                    elif key == JOG_KEY:
-                        f.jog(direction=val)
-                    elif key == HOME_KEY:
-                        f.home()
+                        store_status("OK")
+                    else:
+                        handler = COMMAND_HANDLERS.get(key)
+                        if handler is not None:
+                            handler(f, val)
                 except IOError as e:
-                    redis.store({STATUS_KEY: f"Error {e}"})
+                    store_status(f"Error {e}")
                     log.error(f"Comm error: {e}")
+                except ValueError as e:
+                    log.warning(f"Unable to carry out command ('{key}={val}'): {e}")
     except RedisError as e:
         log.critical(f"Redis server error! {e}")
         sys.exit(1)
@@ -22,6 +22,7 @@ TODO: This program can behave strangely if the heatswitch motor was moved while
 """
 
 import sys
+import time
 import logging
 
 from mkidcontrol.mkidredis import RedisError
@@ -32,6 +33,7 @@ from mkidcontrol.commands import COMMANDSHS, LakeShoreCommand
 from zaber_motion import Library
 
 QUERY_INTERVAL = 1
+MOTOR_POS_REFRESH = 60  # Seconds after which an unchanged motor position is written to the timeseries again
 
 log = logging.getLogger("heatswitchAgent")
 
@@ -48,9 +50,11 @@ ACCELERATION_KEY = "device-settings:heatswitch:acceleration"
 
 STOP_KEY = "heatswitch:stop"
 
-COMMAND_KEYS = [f"command:{k}" for k in SETTING_KEYS + tuple(STOP_KEY)]
+COMMAND_KEYS = tuple(f"command:{k}" for k in SETTING_KEYS + (STOP_KEY,))
 TS_KEYS = (MOTOR_POS,)
 
+IN_MOTION_STATES = frozenset(('opening', 'closing'))  # Lowercased HeatswitchPosition.OPENING/CLOSING
+
 
 def close():
     redis.publish(f"command:{HEATSWITCH_MOVE_KEY}", HeatswitchPosition.CLOSE, store=False)
@@ -70,21 +74,59 @@ def is_closed():
     return redis.read(HEATSWITCH_POSITION_KEY) == HeatswitchPosition.CLOSED
 
 
-def monitor_callback(mpos, mstate):
-    timeseries_d = {MOTOR_POS: mpos}
-    d = {HEATSWITCH_POSITION_KEY: mstate}
+_last_motor_pos = {'pos': None, 'time': 0.0}
+
+
+def monitor_callback(sample):
     try:
-        if mpos is None:
+        if sample is None:
             # N.B. If there is an error on the query, the value passed is None
             redis.store({STATUS_KEY: "Error"})
         else:
-            redis.store(timeseries_d, timeseries=True)
-            redis.store(d)
-            redis.store({STATUS_KEY: "OK"})
+            mpos, mstate = sample
+            now = time.monotonic()
+            # Only add a motor position sample when it moves (or as a periodic heartbeat when it doesn't)
+            if mpos != _last_motor_pos['pos'] or now - _last_motor_pos['time'] >= MOTOR_POS_REFRESH:
+                redis.store({MOTOR_POS: mpos}, timeseries=True)
+                _last_motor_pos.update(pos=mpos, time=now)
+            redis.store({HEATSWITCH_POSITION_KEY: mstate, STATUS_KEY: "OK"})
     except RedisError:
         log.warning('Storing motor position to redis failed')
 
 
+def move_heatswitch(hs, cmd):
+    """
+    Open or close the heat switch as requested by cmd, unless it is already in motion
+    """
+    current_pos = redis.read(HEATSWITCH_POSITION_KEY)
+    if current_pos.lower() in IN_MOTION_STATES:
+        # N.B. Don't try to reverse motion while the heatswitch is opening/closing
+        log.warning(f"Trying to send command {cmd.value} while heatswitch is {current_pos}. Command ignored!")
+    else:
+        log.info(f"Commanding heatswitch to {cmd.value} from heatswitch {current_pos}")
+        position = cmd.value.lower()
+        if position == "open":
+            hs.open()
+        elif position == "close":
+            hs.close()
+        else:
+            log.warning("Illegal command that was not previously handled!")
+
+
+def update_setting(hs, cmd):
+    hs.update_binary_setting(cmd.setting, cmd.value)
+
+
+# Setting key -> value of the last setting command carried out, used to skip repeats of it
+_last_values = {}
+
+# Setting key -> function(hs, cmd) which carries out the command
+COMMAND_HANDLERS = {HEATSWITCH_MOVE_KEY: move_heatswitch,
+                    VELOCITY_KEY: update_setting,
+                    RUNNING_CURRENT_KEY: update_setting,
+                    ACCELERATION_KEY: update_setting}
+
+
 def compute_initial_state(heatswitch):
     """
     Initial states can be opening, closing, opened, or closed
@@ -95,8 +137,8 @@ def compute_initial_state(heatswitch):
         else:
             heatswitch._initialize_position()
 
-        # NB: This is handled by the call to _initialize_position() which keeps the motor and DB in sync
-        position = redis.read(MOTOR_POS)[1]
+        # NB: _initialize_position() keeps the motor and DB in sync, so the position it recorded is current
+        position = heatswitch.last_recorded_position
 
         if position == heatswitch.FULL_CLOSE_POSITION:
             initial_state = HeatswitchPosition.CLOSED
@@ -122,6 +164,10 @@ if __name__ == "__main__":
     redis.setup_redis(ts_keys=TS_KEYS)
     util.setup_logging('heatswitchAgent')
 
+    # Keep a local copy of the device database that detect_devices() uses to identify the motor, so that agent
+    # restarts do not have to fetch it from Zaber each time
+    Library.enable_device_db_store()
+
     try:
         # hs = HeatswitchMotor('/dev/heatswitch', redis, open_position=int((1/2) * 4194303))
         hs = HeatswitchMotor('/dev/heatswitch', redis, open_position=0)
@@ -134,7 +180,7 @@ if __name__ == "__main__":
         redis.store({STATUS_KEY: f"Error: {e}"})
         sys.exit(1)
 
-    hs.monitor(QUERY_INTERVAL, (hs.motor_position, hs.state), value_callback=monitor_callback)
+    hs.monitor(QUERY_INTERVAL, hs.sample, value_callback=monitor_callback)
 
     try:
         while True:
@@ -142,7 +188,19 @@ if __name__ == "__main__":
 
                 log.debug(f"HeatswitchAgent received {key}, {val}.")
                 key = key.removeprefix('command:')
-                if key in SETTING_KEYS:
+                if key == STOP_KEY:
+                    log.info("Stopping the heatswitch motor")
+                    try:
+                        hs.stop()
+                    except Exception as e:
+                        redis.store({STATUS_KEY: f"Error {e}"})
+                        log.error(f"Could not stop the heatswitch motor: {e}")
+                    continue
+                handler = COMMAND_HANDLERS.get(key)
+                if handler is not None:
+                    if key != HEATSWITCH_MOVE_KEY and _last_values.get(key) == val:
+                        log.debug("Ignoring repeated command %s=%s", key, val)
+                        continue
                     try:
                         cmd = LakeShoreCommand(key, val)
                     except ValueError as e:
@@ -150,30 +208,13 @@ if __name__ == "__main__":
                         continue
                     try:
                         log.info(f"Processing command '{cmd}'")
-                        if key == HEATSWITCH_MOVE_KEY:
-                            current_pos = redis.read(HEATSWITCH_POSITION_KEY)
-                            if current_pos.lower() in ['opening', 'closing']:
-                                # N.B. Don't try to reverse motion while the heatswitch is opening/closing
-                                log.warning(f"Trying to send command {val} while heatswitch is {current_pos}. Command ignored!")
-                            else:
-                                log.info(f"Commanding heatswitch to {val} from heatswitch {current_pos}")
-                                if val.lower() == "open":
-                                    hs.open()
-                                elif val.lower() == "close":
-                                    hs.close()
-                                else:
-                                    log.warning("Illegal command that was not previously handled!")
-                        elif key in [VELOCITY_KEY, RUNNING_CURRENT_KEY, ACCELERATION_KEY]:
-                            hs.update_binary_setting(key, val)
-                        elif key == STOP_KEY:
-                            hs.stop()
-                        else:
-                            log.warning(f"Unknown command! Ignoring")
-                        redis.store({cmd.setting: cmd.value})
-                        redis.store({STATUS_KEY: "OK"})
+                        handler(hs, cmd)
+                        redis.store({cmd.setting: cmd.value, STATUS_KEY: "OK"})
+                        _last_values[key] = val
                     except IOError as e:
                         redis.store({STATUS_KEY: f"Error {e}"})
                         log.error(f"Comm error: {e}")
     except RedisError as e:
         log.error(f"Redis server error! {e}")
+        hs.stop_monitor()
         sys.exit(1)
@@ -19,23 +19,21 @@ log = logging.getLogger("laserflipperAgent")
 
 QUERY_INTERVAL = 1
 
-LASER_VALS = ['808', '904', '980', '1120', '1310']
-NAMES = [f"{val} nm" for val in LASER_VALS]
-NAMES.append('mirror')
+LASER_VALS = ('808', '904', '980', '1120', '1310')
+NAMES = tuple(f"{val} nm" for val in LASER_VALS) + ('mirror',)
 
 STATUS_KEY = "status:device:laserflipperduino:status"
 FIRMWARE_KEY = "status:device:laserflipperduino:firmware"
 
 SETTING_KEYS = tuple(COMMANDSLASERFLIPPER.keys())
-COMMAND_KEYS = (f"command:{key}" for key in SETTING_KEYS)
+COMMAND_KEYS = tuple(f"command:{key}" for key in SETTING_KEYS)
 
 MIRROR_FLIP_KEY = 'device-settings:laserflipperduino:flipper:position'
-LASER_KEYS = ('device-settings:laserflipperduino:laserbox:808:power',
-              'device-settings:laserflipperduino:laserbox:904:power',
-              'device-settings:laserflipperduino:laserbox:980:power',
-              'device-settings:laserflipperduino:laserbox:1120:power',
-              'device-settings:laserflipperduino:laserbox:1310:power'
-              )
+LASER_KEYS = frozenset(('device-settings:laserflipperduino:laserbox:808:power',
+                        'device-settings:laserflipperduino:laserbox:904:power',
+                        'device-settings:laserflipperduino:laserbox:980:power',
+                        'device-settings:laserflipperduino:laserbox:1120:power',
+                        'device-settings:laserflipperduino:laserbox:1310:power'))
 
 STATUS_KEYS = ('status:device:laserflipperduino:laser-808',
                'status:device:laserflipperduino:laser-904',
@@ -64,7 +62,7 @@ if __name__ == "__main__":
     try:
         while True:
             for key, val in redis.listen(COMMAND_KEYS):
-                log.debug(f"LaserflipperAgent received {key}: {val}.")
+                log.debug("LaserflipperAgent received %s: %s.", key, val)
                 key = key.removeprefix("command:")
                 if key in SETTING_KEYS:
                     try:
@@ -73,19 +71,17 @@ if __name__ == "__main__":
                         log.warning(f"Ignoring invalid command ('{key}={val}'): {e}")
                         continue
                     try:
-                        log.info(f"Processing command 'cmd'")
+                        log.info("Processing command '%s'", cmd)
                         if key == MIRROR_FLIP_KEY:
                             laserduino.set_mirror_position(cmd.value)
                         elif key in LASER_KEYS:
-                            log.debug(f"Setting laser to {cmd.value}% power. ")
+                            log.debug("Setting laser to %s%% power.", cmd.value)
                             laserduino.set_diode(int(cmd.command), int(cmd.value))
                             log.info("Laser power set")
-                        redis.store({cmd.setting: cmd.value})
-                        redis.store({STATUS_KEY: "OK"})
+                        redis.store({cmd.setting: cmd.value, STATUS_KEY: "OK"})
 
                         statuses = laserduino.statuses()
-                        for i, value in enumerate(statuses.values()):
-                            redis.store({STATUS_KEYS[i]: value})
+                        redis.store(dict(zip(STATUS_KEYS, statuses.values())))
                     except IOError as e:
                         redis.store({STATUS_KEY: f"Error {e}"})
                         log.error(f"Comm error: {e}")
@@ -13,7 +13,8 @@ class SimCommand:
 
         If no value is specified it will create the command as a query
         """
-        if schema_key not in COMMAND_DICT.keys():
+        command = COMMAND_DICT.get(schema_key)
+        if command is None:
             raise ValueError(f'Unknown command: {schema_key}')
 
         self.range = None
@@ -21,8 +22,8 @@ class SimCommand:
         self.value = value
         self.setting = schema_key
 
-        self.command = COMMAND_DICT[self.setting]['command']
-        setting_vals = COMMAND_DICT[self.setting]['vals']
+        self.command = command['command']
+        setting_vals = command['vals']
 
         if isinstance(setting_vals, dict):
             self.mapping = setting_vals
@@ -80,7 +81,8 @@ class LakeShoreCommand:
         is not supported, raise a ValueError.
         """
 
-        if schema_key not in COMMAND_DICT.keys():
+        command = COMMAND_DICT.get(schema_key)
+        if command is None:
             raise ValueError(f'Unknown command: {schema_key}')
 
         if schema_key[-5:] == 'limit' and not limit_vals:
@@ -93,8 +95,8 @@ class LakeShoreCommand:
         self.setting = schema_key
         self.limit_values = limit_vals
 
-        self.command = COMMAND_DICT[self.setting]['command']
-        setting_vals = COMMAND_DICT[self.setting]['vals']
+        self.command = command['command']
+        setting_vals = command['vals']
 
         if isinstance(setting_vals, dict):
             self.mapping = setting_vals
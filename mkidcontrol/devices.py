@@ -7,12 +7,16 @@ TODO: Add 'off' to devices so they don't just query unnecessarily
 from logging import getLogger
 import numpy as np
 import enum
+import fcntl
 import logging
+import re
+import struct
 import time
 import threading
 import serial
 from serial import SerialException
 from lakeshore import InstrumentException
+from zaber_motion import MotionLibException
 from zaber_motion.binary import Connection, BinarySettings, CommandCode
 from FLI.filter_wheel import USBFilterWheel
 from thorlabs_apt_device.devices.tdc001 import TDC001
@@ -438,16 +442,49 @@ class SimDevice(SerialDevice):
         return ret
 
 
+def _int_param(value):
+    """ Default cast for Focus parameter values, which may arrive as float strings (e.g. '2.0') """
+    return int(float(value))
+
+
 class Focus(TDC001):
     MINIMUM_POSITION_ENCODER = 0
     MINIMUM_POSITION_MM = 0
     MAXIMUM_POSITION_ENCODER = 1727750
     MAXIMUM_POSITION_MM = 50
     ENCODER_STEPS_PER_MM = 34555
+    MM_PER_ENCODER_STEP = 1 / ENCODER_STEPS_PER_MM
+    JOG_DIRECTIONS = frozenset(('forward', 'reverse'))
+    MOTION_FLAGS = ('moving_forward', 'moving_reverse', 'jogging_forward', 'jogging_reverse', 'homing')
+    MOTION_POLL_INTERVAL = 0.1
+    MOTION_SETTLE_POLLS = 5
+
+    # Parameter type -> (current parameters attribute, setter, function mapping the parameters to setter arguments)
+    PARAM_SETTERS = {'home': ('homeparams', 'set_home_params',
+                              lambda p: {'velocity': p['home_velocity'], 'offset_distance': p['offset_distance'],
+                                         'direction': 'forward' if p['home_dir'] == 1 else 'reverse'}),
+                     'jog': ('jogparams', 'set_jog_params',
+                             lambda p: {'size': p['step_size'], 'acceleration': p['acceleration'],
+                                        'max_velocity': p['max_velocity'], 'continuous': p['jog_mode'] == 1,
+                                        'immediate_stop': p['stop_mode'] == 1}),
+                     'move': ('genmoveparams', 'set_move_params',
+                              lambda p: {'backlash_distance': p['backlash_distance']}),
+                     'velocity': ('velparams', 'set_velocity_params',
+                                  lambda p: {'acceleration': p['acceleration'], 'max_velocity': p['max_velocity']})}
+    PARAM_CASTS = {'direction': lambda v: str(v).lower(),
+                   'continuous': lambda v: v in (True, 'True')}
 
     def __init__(self, name, port=None, home=False):
         super().__init__(serial_port=port, home=home)
         self.name = name
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        # Hold an exclusive lock on the port (as pyserial's exclusive=True would) so a second process can't talk over us
+        try:
+            fcntl.flock(self._port.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.close()
+            raise IOError(f"Focus slider port {port} is already held by another process")
 
     def home_slider(self):
         """
@@ -457,6 +494,7 @@ class Focus(TDC001):
             self.home()
         except (IOError, SerialException) as e:
             raise IOError(f"Error communicating with focus slider: {e}")
+        self.poll_now()
 
     def stop_slider(self, now=False):
         """
@@ -477,19 +515,54 @@ class Focus(TDC001):
         return self.status['enc_count']
 
     def position(self):
-        return {'mm': self.status['position'], 'encoder': self.status['enc_count']}
+        status = self.status
+        return {'mm': status['position'], 'encoder': status['enc_count']}
+
+    def poll_now(self):
+        """ Wake the monitor thread to poll immediately, then quickly until the slider has stopped moving """
+        self._wake_event.set()
+
+    def stop_monitor(self):
+        """ Stop the monitor thread (if running) without waiting for the rest of its poll interval """
+        self._stop_event.set()
+        self._wake_event.set()
+
+    @property
+    def moving(self):
+        status = self.status
+        return any(status[flag] for flag in self.MOTION_FLAGS)
 
     def jog(self, direction='forward'):
         """
         Jog the focus stage 'forward' or 'reverse'. This will follow the settings in self.jogparams
         """
-        if direction.lower() not in ('forward', 'reverse'):
-            raise ValueError(f"Unknown jog direction, '{direction.lower()}'. Usable values are 'forward'/'reverse'")
+        if direction not in self.JOG_DIRECTIONS:
+            direction = direction.lower()
+            if direction not in self.JOG_DIRECTIONS:
+                raise ValueError(f"Unknown jog direction, '{direction}'. Usable values are 'forward'/'reverse'")
 
         try:
             self.move_jog(direction=direction)
         except (IOError, SerialException) as e:
             raise IOError(f"Error communicating with focus slider: {e}")
+        self.poll_now()
+
+    def _clamp(self, dest_encoder, error_on_disallowed=False):
+        """
+        Limit the encoder position dest_encoder to the allowed range of the slider. Out of range positions raise a
+        ValueError if error_on_disallowed, otherwise the nearest allowed position is returned
+        """
+        allowed_encoder = min(max(dest_encoder, self.MINIMUM_POSITION_ENCODER), self.MAXIMUM_POSITION_ENCODER)
+        if allowed_encoder != dest_encoder:
+            msg = (f"Requested a move to {dest_encoder} ({dest_encoder * self.MM_PER_ENCODER_STEP} mm), outside of the "
+                   f"allowed range ({self.MINIMUM_POSITION_ENCODER}-{self.MAXIMUM_POSITION_ENCODER}/"
+                   f"{self.MINIMUM_POSITION_MM}-{self.MAXIMUM_POSITION_MM} mm)")
+            if error_on_disallowed:
+                log.debug(msg)
+                raise ValueError(msg)
+            log.debug("%s. Moving instead to %d (%g mm)", msg, allowed_encoder,
+                      allowed_encoder * self.MM_PER_ENCODER_STEP)
+        return allowed_encoder
 
     def move_to(self, dest:float, units='mm', error_on_disallowed=False):
         """
@@ -503,38 +576,25 @@ class Focus(TDC001):
         dest = float(dest)
 
         if units == 'mm':
-            dest_encoder = dest * self.ENCODER_STEPS_PER_MM
+            dest_encoder = int(dest * self.ENCODER_STEPS_PER_MM)
             dest_mm = dest
         elif units == 'encoder':
-            dest_mm = dest / self.ENCODER_STEPS_PER_MM
-            dest_encoder = dest
+            dest_mm = dest * self.MM_PER_ENCODER_STEP
+            dest_encoder = int(dest)
         else:
             raise ValueError(f"Invalid units: '{units}'. Legal values are 'mm' and 'encoder'")
 
-        log.info(f"Move requested to {dest_mm} mm (encoder position {dest_encoder}).")
+        log.info("Move requested to %g mm (encoder position %d).", dest_mm, dest_encoder)
+        allowed_encoder = self._clamp(dest_encoder, error_on_disallowed=error_on_disallowed)
+        if allowed_encoder != dest_encoder:
+            dest_encoder = allowed_encoder
+            dest_mm = dest_encoder * self.MM_PER_ENCODER_STEP
         try:
-            if dest_encoder > self.MAXIMUM_POSITION_ENCODER:
-                if error_on_disallowed:
-                    log.debug(f"Requested a move to {dest_encoder} ({dest_mm}mm), beyond the maximum value ({self.MAXIMUM_POSITION_ENCODER}/{self.MAXIMUM_POSITION_MM} mm)")
-                    raise ValueError(f"Requested a move to {dest_encoder} ({dest_mm}mm), beyond the maximum value ({self.MAXIMUM_POSITION_ENCODER}/{self.MAXIMUM_POSITION_MM} mm)")
-                else:
-                    log.debug(f"Requested a move to {dest_encoder} ({dest_mm}mm), beyond the maximum value ({self.MAXIMUM_POSITION_ENCODER}/{self.MAXIMUM_POSITION_MM} mm). "
-                              f"Attempting a move to {self.MAXIMUM_POSITION_ENCODER} ({self.MAXIMUM_POSITION_MM} mm)")
-                    dest_encoder = self.MAXIMUM_POSITION_ENCODER
-                    dest_mm = self.MAXIMUM_POSITION_MM
-            elif dest_encoder < self.MINIMUM_POSITION_ENCODER:
-                if error_on_disallowed:
-                    log.debug(f"Requested a move to {dest_encoder} ({dest_mm}mm), beyond the minimum value ({self.MINIMUM_POSITION_ENCODER}/{self.MINIMUM_POSITION_MM} mm)")
-                    raise ValueError(f"Requested a move to {dest_encoder} ({dest_mm}mm), beyond the minimum value ({self.MINIMUM_POSITION_ENCODER}/{self.MINIMUM_POSITION_MM} mm)")
-                else:
-                    log.debug(f"Requested a move to {dest_encoder} ({dest_mm}mm), beyond the minimum value ({self.MINIMUM_POSITION_ENCODER}/{self.MINIMUM_POSITION_MM} mm). "
-                              f"Moving to {self.MINIMUM_POSITION_ENCODER} ({self.MINIMUM_POSITION_MM} mm)")
-                    dest_encoder = self.MINIMUM_POSITION_ENCODER
-                    dest_mm = self.MINIMUM_POSITION_MM
-            self.move_absolute(int(dest_encoder))
-            log.debug(f"Moved to position {dest_encoder} ({dest_mm} mm)")
+            self.move_absolute(dest_encoder)
+            log.debug("Moved to position %d (%g mm)", dest_encoder, dest_mm)
         except (IOError, SerialException) as e:
             raise IOError(f"Error communicating with focus slider: {e}")
+        self.poll_now()
 
     def move_by(self, dist: float, units='mm', error_on_disallowed=False):
         """
@@ -551,64 +611,47 @@ class Focus(TDC001):
         dist = float(dist)
 
         if units == 'mm':
-            dist_encoder = dist * self.ENCODER_STEPS_PER_MM
+            dist_encoder = int(dist * self.ENCODER_STEPS_PER_MM)
             dist_mm = dist
         elif units == 'encoder':
-            dist_mm = dist / self.ENCODER_STEPS_PER_MM
-            dist_encoder = dist
+            dist_mm = dist * self.MM_PER_ENCODER_STEP
+            dist_encoder = int(dist)
         else:
             raise ValueError(f"Invalid units: '{units}'. Legal values are 'mm' and 'encoder'")
 
         current_position_enc = self.position_encoder
-        desired_position_enc = current_position_enc + dist
+        desired_position_enc = current_position_enc + dist_encoder
+        allowed_position_enc = self._clamp(desired_position_enc, error_on_disallowed=error_on_disallowed)
+        if allowed_position_enc != desired_position_enc:
+            dist_encoder = allowed_position_enc - current_position_enc
+            dist_mm = dist_encoder * self.MM_PER_ENCODER_STEP
 
         try:
-            if desired_position_enc >= self.MAXIMUM_POSITION_ENCODER:
-                if error_on_disallowed:
-                    log.debug(
-                        f"Requested a move by {dist_encoder} ({dist_mm}mm), beyond the maximum allowed position ({self.MAXIMUM_POSITION_ENCODER}/{self.MAXIMUM_POSITION_MM} mm)")
-                    raise ValueError(
-                        f"Requested a move by {dist_encoder} ({dist_mm}mm), beyond the maximum allowed position ({self.MAXIMUM_POSITION_ENCODER}/{self.MAXIMUM_POSITION_MM} mm)")
-                else:
-                    log.debug(
-                        f"Requested a move by {dist_encoder} ({dist_mm}mm), beyond the maximum allowed position ({self.MAXIMUM_POSITION_ENCODER}/{self.MAXIMUM_POSITION_MM} mm). "
-                        f"Moving instead to {self.MAXIMUM_POSITION_ENCODER} ({self.MAXIMUM_POSITION_MM} mm)")
-                    dist_encoder = self.MAXIMUM_POSITION_ENCODER - current_position_enc
-                    dist_mm = dist_encoder / self.ENCODER_STEPS_PER_MM
-            elif desired_position_enc <= self.MINIMUM_POSITION_ENCODER:
-                if error_on_disallowed:
-                    log.debug(
-                        f"Requested a move by {dist_encoder} ({dist_mm}mm), beyond the minimum allowed position ({self.MINIMUM_POSITION_ENCODER}/{self.MINIMUM_POSITION_MM} mm)")
-                    raise ValueError(
-                        f"Requested a move by {dist_encoder} ({dist_mm}mm), beyond the minimum allowed position ({self.MINIMUM_POSITION_ENCODER}/{self.MINIMUM_POSITION_MM} mm)")
-                else:
-                    log.debug(
-                        f"Requested a move by {dist_encoder} ({dist_mm}mm), beyond the minimum allowed position ({self.MINIMUM_POSITION_ENCODER}/{self.MINIMUM_POSITION_MM} mm). "
-                        f"Moving instead to {self.MINIMUM_POSITION_ENCODER} ({self.MINIMUM_POSITION_MM} mm)")
-                    dist_encoder = self.MINIMUM_POSITION_ENCODER - current_position_enc
-                    dist_mm = dist_encoder / self.ENCODER_STEPS_PER_MM
-            log.info(f"Attempting to move by {dist_encoder} steps ({dist_mm} mm)")
+            log.info("Attempting to move by %d steps (%g mm)", dist_encoder, dist_mm)
             self.move_relative(dist_encoder)
-            log.info(f"Move successful")
+            log.info("Move successful")
         except (IOError, SerialException) as e:
             raise IOError(f"Error communicating with focus slider: {e}")
+        self.poll_now()
 
     def update_param(self, key, value):
-        _, _, param_type, param = key.split(":")
-        param.replace('-', '_')
+        """
+        Update a single parameter given its 'device-settings:focus:<type>-params:<param>' key, the remaining
+        parameters of that type are resent with their current values
+        """
+        param_type, param = key.split(":")[-2:]
+        param_type = param_type.removesuffix('-params')
+        param = param.replace('-', '_')
         try:
-            to_change = self.params[param_type]
-            to_change[param] = value
-            if 'home' in param_type:
-                self.set_home_params(to_change)
-            elif 'jog' in param_type:
-                self.set_jog_params(to_change)
-            elif 'move' in param_type:
-                self.set_move_params(to_change)
-            elif 'velocity' in param_type:
-                self.set_velocity_params(to_change)
-            else:
-                raise ValueError(f"Unknown parameter type to update for focus slider!")
+            params, setter, to_args = self.PARAM_SETTERS[param_type]
+        except KeyError:
+            raise ValueError(f"Unknown parameter type '{param_type}' to update for focus slider!")
+        args = to_args(getattr(self, params))
+        if param not in args:
+            raise ValueError(f"Unknown {param_type} parameter '{param}' for focus slider!")
+        args[param] = self.PARAM_CASTS.get(param, _int_param)(value)
+        try:
+            getattr(self, setter)(**args)
         except (IOError, SerialException) as e:
             log.getChild('io').warning(f"Can't communicate with focus slider! {e}")
             raise IOError(f"Can't communicate with focus slider! {e}")
@@ -639,6 +682,10 @@ class Focus(TDC001):
         When there is a 1-1 correspondence the callback is not called in the event of a monitoring error.
         If a single callback is present for multiple monitor functions values that had errors will be sent as None.
         Function must accept as many arguments as monitor functions.
+
+        While the slider is in motion (or just after a move/jog/home or poll_now) the monitors are polled every
+        MOTION_POLL_INTERVAL seconds, falling back to every interval seconds once it has settled. The thread exits
+        promptly once stop_monitor is called.
         """
         if not isinstance(monitor_func, (list, tuple)):
             monitor_func = (monitor_func,)
@@ -647,8 +694,11 @@ class Focus(TDC001):
         if not (value_callback is None or len(monitor_func) == len(value_callback) or len(value_callback) == 1):
             raise ValueError('When specified, the number of callbacks must be one or the number of monitor functions')
 
+        self._stop_event.clear()
+
         def f():
-            while True:
+            fast_polls = 0
+            while not self._stop_event.is_set():
                 vals = []
                 for func in monitor_func:
                     try:
@@ -671,7 +721,16 @@ class Focus(TDC001):
                         except Exception as e:
                             log.error(f"Callback {cb} error. args={vals}.", exc_info=True)
 
-                time.sleep(interval)
+                if self._wake_event.is_set():
+                    self._wake_event.clear()
+                    fast_polls = self.MOTION_SETTLE_POLLS
+                elif fast_polls and not self.moving:
+                    fast_polls -= 1
+
+                if fast_polls:
+                    self._stop_event.wait(timeout=self.MOTION_POLL_INTERVAL)
+                else:
+                    self._wake_event.wait(timeout=interval)
 
         self._monitor_thread = threading.Thread(target=f, name='Monitor Thread')
         self._monitor_thread.daemon = True
@@ -680,12 +739,35 @@ class Focus(TDC001):
 
 class FilterWheel(USBFilterWheel):
     def __init__(self, name, port=None, model=b"CFW-2-7", filters=None):
+        self._last_pos = None
         super().__init__(dev_name=port, model=model)
         self.name = name
         self.set_filter_pos(0)  # Initialize to the closed position.
         self.model = model.decode()
         self.filters = filters
 
+    def set_filter_pos(self, pos):
+        """
+        Overrides USBFilterWheel method to record the position once the move succeeds
+        """
+        self._last_pos = None  # Unknown if the move fails partway
+        super().set_filter_pos(pos)
+        self._last_pos = pos
+
+    def get_filter_pos(self):
+        """
+        Overrides USBFilterWheel method to record the position it reports
+        """
+        self._last_pos = super().get_filter_pos()
+        return self._last_pos
+
+    @property
+    def last_position(self):
+        """
+        The position the wheel was last moved to or reported, without querying it. None if it is not known
+        """
+        return self._last_pos
+
     @property
     def current_filter_position(self):
         """
@@ -787,6 +869,11 @@ class HeatswitchMotor:
     DEFAULT_RUNNING_CURRENT = 13  # Current can be set between 10 (highest) and 127 (lowest). Lower current (higher number)
     # will avoid damaging the heat switch if limit is reached by mistake
     DEFAULT_ACCELERATION = 2  # Default acceleration from ARCONS
+    QUERY_RETRY_DELAYS = (0, 0.01, 0.02, 0.04, 0.08)  # Seconds to wait before each attempt to query the motor position
+    IDLE_QUERY_EVERY = 60  # While the motor is idle, sample() only queries it on every Nth call
+    BINARY_SETTINGS = {'device-settings:heatswitch:max-velocity': BinarySettings.TARGET_SPEED,
+                       'device-settings:heatswitch:running-current': BinarySettings.RUNNING_CURRENT,
+                       'device-settings:heatswitch:acceleration': BinarySettings.ACCELERATION}
 
     def __init__(self, port, redis_inst, set_mode=True, open_position=None, close_position=None):
         c = Connection.open_serial_port(port)
@@ -798,6 +885,12 @@ class HeatswitchMotor:
         self.last_recorded_position = None
         self.last_10_positions = []
         self.last_move = 0
+        self._stop_event = threading.Event()
+        self._moving = False
+        self._idle_samples = 0
+        # Guards the recorded position/motion bookkeeping shared by the monitor thread and the commanding thread. It is
+        # never held while the motor is moving.
+        self._lock = threading.RLock()
 
         if open_position:
             self.FULL_OPEN_POSITION = open_position
@@ -810,24 +903,33 @@ class HeatswitchMotor:
         self._initialize_position()
 
         if set_mode:
-            self.update_binary_setting(BinarySettings.DEVICE_MODE, 8)
-            self.update_binary_setting(BinarySettings.TARGET_SPEED, self.DEFAULT_MAX_VELOCITY)
-            self.update_binary_setting(BinarySettings.RUNNING_CURRENT, self.DEFAULT_RUNNING_CURRENT)
-            self.update_binary_setting(BinarySettings.ACCELERATION, self.DEFAULT_ACCELERATION)
+            # The settings we write are known, only read back the ones we don't set
+            self.device_mode = 8
+            self.max_velocity = self.DEFAULT_MAX_VELOCITY
+            self.running_current = self.DEFAULT_RUNNING_CURRENT
+            self.acceleration = self.DEFAULT_ACCELERATION
+            self.update_binary_setting(BinarySettings.DEVICE_MODE, self.device_mode)
+            self.update_binary_setting(BinarySettings.TARGET_SPEED, self.max_velocity)
+            self.update_binary_setting(BinarySettings.RUNNING_CURRENT, self.running_current)
+            self.update_binary_setting(BinarySettings.ACCELERATION, self.acceleration)
+        else:
+            self.running_current = self.hs.settings.get(BinarySettings.RUNNING_CURRENT)
+            self.acceleration = self.hs.settings.get(BinarySettings.ACCELERATION)
+            self.max_velocity = self.hs.settings.get(BinarySettings.TARGET_SPEED)
+            self.device_mode = self.hs.settings.get(BinarySettings.DEVICE_MODE)
 
-        self.running_current = self.hs.settings.get(BinarySettings.RUNNING_CURRENT)
-        self.acceleration = self.hs.settings.get(BinarySettings.ACCELERATION)
         self.max_position = min(self.hs.settings.get(BinarySettings.MAXIMUM_POSITION), self.FULL_CLOSE_POSITION)
         self.min_position = self.FULL_OPEN_POSITION
-        self.max_velocity = self.hs.settings.get(BinarySettings.TARGET_SPEED)
         self.max_relative_move = self.hs.settings.get(BinarySettings.MAXIMUM_RELATIVE_MOVE)
-        self.device_mode = self.hs.settings.get(BinarySettings.DEVICE_MODE)
 
     def _initialize_position(self):
         """
         :return:
         """
-        reported_position = int(self.motor_position())
+        reported_position = self.motor_position()
+        if reported_position is None:
+            raise IOError("Unable to query the heat switch motor position to initialize it")
+        reported_position = int(reported_position)
         last_recorded_position = int(self.redis_inst.read(self.MOTOR_POS_KEY)[1])
 
         if (reported_position == self.FULL_CLOSE_POSITION) or (last_recorded_position == self.FULL_CLOSE_POSITION):
@@ -849,83 +951,124 @@ class HeatswitchMotor:
             self.hs.generic_command(CommandCode.SET_CURRENT_POSITION, last_recorded_position)
 
         self.initialized = True
-        self.last_recorded_position = self.motor_position()
+        # Every branch above leaves the device reporting last_recorded_position, no need to ask it again. Record it as
+        # the second sample so state() has a direction to compare against.
+        with self._lock:
+            self.last_recorded_position = last_recorded_position
+            self.last_10_positions.append(last_recorded_position)
+            self.last_10_positions = self.last_10_positions[-10:]
 
-    def state(self):
-        if self.motor_position() == self.FULL_CLOSE_POSITION:
-            log.debug(f"Motor is {HeatswitchPosition.CLOSED}")
+    def state(self, position=None):
+        """
+        The heat switch state at motor position <position>, if it is not given the motor position is queried
+        """
+        if position is None:
+            position = self.motor_position()
+            if position is None:
+                raise IOError("Unable to query the heat switch motor position")
+        if position == self.FULL_CLOSE_POSITION:
+            log.debug("Motor is %s", HeatswitchPosition.CLOSED)
             return HeatswitchPosition.CLOSED
-        elif self.motor_position() == self.FULL_OPEN_POSITION:
-            log.debug(f"Motor is {HeatswitchPosition.OPENED}")
+        elif position == self.FULL_OPEN_POSITION:
+            log.debug("Motor is %s", HeatswitchPosition.OPENED)
             return HeatswitchPosition.OPENED
         else:
-            if self.last_10_positions[-1] >= self.last_10_positions[-2]:
-                log.debug(f"Motor is {HeatswitchPosition.CLOSING}")
-                return HeatswitchPosition.CLOSING
+            with self._lock:
+                if len(self.last_10_positions) >= 2:
+                    closing = self.last_10_positions[-1] >= self.last_10_positions[-2]
+                else:
+                    closing = self.last_move >= 0
+            return self._travel_state(closing)
+
+    def _travel_state(self, closing):
+        """ The heat switch state at a position between fully open and fully closed """
+        if closing:
+            log.debug("Motor is %s", HeatswitchPosition.CLOSING)
+            return HeatswitchPosition.CLOSING
+        else:
+            log.debug("Motor is %s", HeatswitchPosition.OPENING)
+            return HeatswitchPosition.OPENING
+
+    def sample(self):
+        """
+        Return the motor position along with the heat switch state, i.e. (position, state). The motor is only queried
+        while it is moving (and on every IDLE_QUERY_EVERY-th call as a check), otherwise the last recorded position
+        is used. An idle motor short of fully open or closed reports the direction of the last recorded move, as the
+        queried position history is not refreshed while idle.
+        """
+        with self._lock:
+            if (self._moving or self.last_recorded_position is None or len(self.last_10_positions) < 2 or
+                    self._idle_samples >= self.IDLE_QUERY_EVERY):
+                self._idle_samples = 0
+                position = None
             else:
-                log.debug(f"Motor is {HeatswitchPosition.OPENING}")
-                return HeatswitchPosition.OPENING
+                self._idle_samples += 1
+                position = self.last_recorded_position
+                closing = self.last_move >= 0
+        if position is None:
+            position = self.motor_position()
+            if position is None:
+                raise IOError("Unable to query the heat switch motor position")
+            return position, self.state(position)
+        if position in (self.FULL_OPEN_POSITION, self.FULL_CLOSE_POSITION):
+            return position, self.state(position)
+        return position, self._travel_state(closing)
 
     def motor_position(self):
-        for i in range(5):
+        """
+        Query the motor position, retrying with an increasing delay on communication errors.
+        Returns None if the motor could not be queried.
+        """
+        for i, delay in enumerate(self.QUERY_RETRY_DELAYS):
+            time.sleep(delay)
             try:
                 position = self.hs.get_position()
-                log.debug(f"Motor has reported that it is at position {position}")
-                self.last_10_positions.append(position)
-                self.last_10_positions = self.last_10_positions[-10:]
+                log.debug("Motor has reported that it is at position %s", position)
+                with self._lock:
+                    self.last_10_positions.append(position)
+                    self.last_10_positions = self.last_10_positions[-10:]
                 return position
-            except (serial.SerialException, Exception) as e:
-                log.getChild('io').debug(f"Error in querying heat switch motor. Attempt {i+1} of 5 failed. Trying again.")
+            except (serial.SerialException, MotionLibException) as e:
+                log.getChild('io').debug("Error in querying heat switch motor. Attempt %d of %d failed: %s", i + 1,
+                                         len(self.QUERY_RETRY_DELAYS), e)
+        log.getChild('io').error("Unable to query the heat switch motor position!")
+        return None
 
     def move_to(self, pos, timeout=TIMEOUT, error_on_disallowed=False):
         """
-        TODO: Test and validate
-        :param pos:
-        :param error_on_disallowed:
-        :return:
+        Move the motor to position <pos>, restricted to the allowed range of motion. If error_on_disallowed a move
+        outside of that range raises an exception instead.
+        :return: The last recorded position
         """
         last_pos = self.last_recorded_position
-        if (last_pos < self.min_position) or (last_pos > self.max_position):
-            if last_pos < self.min_position:
-                log.warning(f"Requested move to {last_pos} not allowed. Attempting to restrict to FULL_OPEN_POSITION: {self.min_position}")
-            elif last_pos > self.max_position:
-                log.warning(f"Requested move to {last_pos} not allowed. Attempting to restrict to FULL_CLOSE_POSITION: {self.max_position}")
-
-        if error_on_disallowed:
-            raise Exception(f"Move requested from {last_pos} to {pos} not allowed. Out of range")
-        else:
-            if (last_pos < self.min_position) or (last_pos > self.max_position):
-                if last_pos < self.min_position:
-                    log.warning(f"Restricting move to FULL_OPEN_POSITION: {self.min_position}. Cannot move to {pos}")
-                    pos = self.min_position
-                elif last_pos > self.max_position:
-                    log.warning(f"Restricting move to FULL_CLOSE_POSITION: {self.max_position}. Cannot move to {pos}")
-                    pos = self.max_position
-                try:
-                    log.info(f"Move requested to {pos} from {last_pos}")
-                    self.hs.move_absolute(pos, timeout=timeout)
-                    self.last_move = pos - last_pos
-                    self.last_recorded_position = pos
-                    log.info(f"Successfully moved to {self.last_recorded_position}")
-                except:
-                    log.error(f"Move failed!!")
-            else:
-                try:
-                    log.info(f"Move requested to {pos} from {last_pos}")
-                    self.hs.move_absolute(pos, timeout=timeout)
-                    self.last_move = pos - last_pos
-                    self.last_recorded_position = pos
-                    log.info(f"Successfully moved to {self.last_recorded_position}")
-                except:
-                    log.error(f"Move failed!!")
+        allowed_pos = min(self.max_position, max(self.min_position, pos))
+        if allowed_pos != pos:
+            if error_on_disallowed:
+                raise Exception(f"Move requested from {last_pos} to {pos} not allowed. Out of range")
+            log.warning(f"Requested move to {pos} not allowed. Restricting move to the nearest allowed position "
+                        f"({allowed_pos}) in ({self.min_position}, {self.max_position})")
+            pos = allowed_pos
+
+        self._moving = True
+        try:
+            log.info(f"Move requested to {pos} from {last_pos}")
+            self.hs.move_absolute(pos, timeout=timeout)
+            with self._lock:
+                self.last_move = pos - last_pos
+                self.last_recorded_position = pos
+            log.info(f"Successfully moved to {pos}")
+        except:
+            log.error(f"Move failed!!")
+        finally:
+            self._moving = False
 
         return self.last_recorded_position
 
     def move_by(self, dist, timeout=TIMEOUT, error_on_disallowed=False):
         """
-        :param dist:
-        :param error_on_disallowed:
-        :return:
+        Move the motor by <dist> steps, restricted to the maximum relative move and the allowed range of motion. If
+        error_on_disallowed a move outside of the allowed range raises an exception instead.
+        :return: The last recorded position
         """
         pos = np.copy(self.last_recorded_position)
         if abs(dist) > self.max_relative_move:
@@ -943,38 +1086,31 @@ class HeatswitchMotor:
             new_dist = new_final_pos - pos
             if error_on_disallowed:
                 raise Exception(f"Move requested from {pos} to {final_pos} ({dist} steps) is not allowed")
-            else:
-                log.warning(f"Move requested from {pos} to {final_pos} ({dist} steps) is not "
-                         f"allowed, restricting move to furthest allowed position of {new_final_pos} ({new_dist} steps).")
-                try:
-                    new_pos = self.hs.move_relative(new_dist, timeout=timeout)
-                    if new_pos == self.motor_position():
-                        self.last_recorded_position = new_pos
-                        self.last_move = new_dist
-                        log.info(f"Successfully moved to {self.last_recorded_position}")
-                    else:
-                        log.critical(f"Reported motor position ({self.motor_position()}) not equal to expected destination ({new_pos})!\n"
-                                     f"Setting last recorded position to {self.motor_position()}")
-                        self.last_recorded_position = self.motor_position()
-                        self.last_move = self.motor_position() - pos
-                except:
-                    log.error(f"Move failed!!")
+            log.warning(f"Move requested from {pos} to {final_pos} ({dist} steps) is not "
+                        f"allowed, restricting move to furthest allowed position of {new_final_pos} ({new_dist} steps).")
+            dist = new_dist
         else:
             log.info(f"Move requested from {pos} to {final_pos} ({dist} steps). Moving now...")
-            try:
-                new_pos = self.hs.move_relative(dist, timeout=timeout)
-                if new_pos == self.motor_position():
+
+        self._moving = True
+        try:
+            new_pos = self.hs.move_relative(dist, timeout=timeout)
+            actual = self.motor_position()
+            if actual is None or new_pos == actual:
+                with self._lock:
                     self.last_recorded_position = new_pos
                     self.last_move = dist
-                    log.info(f"Successfully moved to {self.last_recorded_position}")
-                else:
-                    log.critical(
-                        f"Reported motor position ({self.motor_position()}) not equal to expected destination ({new_pos})!\n"
-                        f"Setting last recorded position to {self.motor_position()}")
-                    self.last_recorded_position = self.motor_position()
-                    self.last_move = self.motor_position() - pos
-            except:
-                log.error(f"Move failed!!")
+                log.info(f"Successfully moved to {new_pos}")
+            else:
+                log.critical(f"Reported motor position ({actual}) not equal to expected destination ({new_pos})!\n"
+                             f"Setting last recorded position to {actual}")
+                with self._lock:
+                    self.last_recorded_position = actual
+                    self.last_move = actual - pos
+        except:
+            log.error(f"Move failed!!")
+        finally:
+            self._moving = False
 
         return self.last_recorded_position
 
@@ -1003,14 +1139,12 @@ class HeatswitchMotor:
             raise Exception(f"Move failed or illegal move requested: {e}")
 
     def update_binary_setting(self, key:(str, BinarySettings), value):
+        """
+        Set a zaber BinarySetting, either directly or by its 'device-settings:heatswitch:*' redis key
+        """
         if isinstance(key, str):
-            key = key.split(':')[-1]
-            KEYDICT = {'max-velocity': BinarySettings.TARGET_SPEED,
-                       'running-current': BinarySettings.RUNNING_CURRENT,
-                       'acceleration': BinarySettings.ACCELERATION}
-            self.hs.settings.set(KEYDICT[key], value)
-        else:
-            self.hs.settings.set(key, value)
+            key = self.BINARY_SETTINGS[key]
+        self.hs.settings.set(key, value)
 
     def _set_position_value(self, value):
         """
@@ -1047,6 +1181,8 @@ class HeatswitchMotor:
         if not (value_callback is None or len(monitor_func) == len(value_callback) or len(value_callback) == 1):
             raise ValueError('When specified, the number of callbacks must be one or the number of monitor functions')
 
+        self._stop_event.clear()
+
         def f():
             while True:
                 vals = []
@@ -1071,12 +1207,21 @@ class HeatswitchMotor:
                         except Exception as e:
                             log.error(f"Callback {cb} error. args={vals}.", exc_info=True)
 
-                time.sleep(interval)
+                if self._stop_event.wait(interval):
+                    return
 
         self._monitor_thread = threading.Thread(target=f, name='Monitor Thread')
         self._monitor_thread.daemon = True
         self._monitor_thread.start()
 
+    def stop_monitor(self):
+        """
+        Stop the monitor thread (if running), waiting for any poll in progress to finish
+        """
+        self._stop_event.set()
+        if getattr(self, '_monitor_thread', None) is not None:
+            self._monitor_thread.join()
+
 
 class LakeShoreDevice(SerialDevice):
     def __init__(self, name, port, baudrate=9600, timeout=0.1, connect=True, valid_models=None,
@@ -2548,33 +2693,39 @@ class Hemtduino(SerialDevice):
 
 class Laserflipperduino(SerialDevice):
     VALID_FIRMWARES = (0.0, 0.1)
+    PWM_LUT = bytes(int(v / 100 * 255) for v in range(101))  # Integer percent power -> 0-255 PWM byte
+    STATUS_RE = re.compile(rb'(\d+):([\d.]+)')  # One 'pin:value' pair of the status reply
+    MIRROR_POSITIONS = {'down': 0, 'up': 1}
 
     def __init__(self, port, baudrate=115200, timeout=1, connect=True, lasernames=None):
         super().__init__(port, baudrate, timeout, name='laserflipperduino')
         if connect:
             self.connect(raise_errors=True)
-        self.status = {0: 0.0,
-                       1: 0.0,
-                       2: 0.0,
-                       3: 0.0,
-                       4: 0.0,
-                       5: 0.0}
+        self.status = [0.0] * 6  # Indexed by pin: lasers 0-4, mirror 5
         self.terminator = ''
+        self._send_buf = bytearray(2)
         self.names = lasernames
 
     def _postconnect(self):
         """
         Overwrites serialDevice _postconnect function. Sleeps for an appropriate amount of time to let the arduino get
-        booted up properly so the first queries don't return nonsense (or nothing)
+        booted up properly so the first queries don't return nonsense (or nothing). Also asks the kernel to drop the
+        USB-serial latency timer so replies are delivered as soon as they arrive.
         """
         time.sleep(2)
+        try:
+            self.ser.set_low_latency_mode(True)
+        except (AttributeError, ValueError, IOError) as e:
+            log.getChild('io').debug("Low latency mode unavailable on %s: %s", self.port, e)
 
     def format_msg(self, msg):
         """
         Overwrites function from SerialDevice superclass.
         msg is expected to be either a tuple, array, or bytearray of length 2
+        Packs into a reused buffer, which is safe as send holds the lock until the write completes
         """
-        return bytearray(msg)
+        struct.pack_into('BB', self._send_buf, 0, *msg)
+        return self._send_buf
 
     def send(self, msg: (bytearray, tuple), connect=True):
         """
@@ -2587,20 +2738,51 @@ class Laserflipperduino(SerialDevice):
                 self.connect()
             try:
                 msg = self.format_msg(msg)
-                log.getChild('io').debug(f"Sending '{msg}'")
+                log.getChild('io').debug("Sending '%s'", msg)
                 self.ser.write(msg)
             except (serial.SerialException, IOError) as e:
                 self.disconnect()
                 log.getChild('io').error(f"...failed: {e}")
                 raise e
 
+    def receive(self):
+        """
+        Overrides method from base class
+        Receives a single line reply and returns it as stripped bytes. Replies are plain ASCII 'pin:value' fields,
+        which int() and float() parse directly, so no decoding is done. Raises IOError on a serial error.
+        """
+        with self._rlock:
+            try:
+                data = self.ser.readline()
+                log.getChild('io').debug("Read %s from %s", data, self.name)
+                return data.strip()
+            except (IOError, serial.SerialException) as e:
+                self.disconnect()
+                log.getChild('io').debug("Receive failed %s", e)
+                raise IOError(e)
+
+    def query(self, cmd: (bytearray, tuple), **kwargs):
+        """
+        Overrides method from base class
+        Send command and wait for a response, kwargs passed to send, raises only IOError
+
+        Every reply from the arduino is a single newline terminated line so readline returns as soon as it is
+        complete, with the serial timeout as the upper bound. No fixed sleep is needed between send and receive.
+        """
+        with self._rlock:
+            try:
+                self.send(cmd, **kwargs)
+                return self.receive()
+            except Exception as e:
+                raise IOError(e)
+
     @property
     def firmware(self):
         """ Return the firmware string or raise IOError """
         try:
-            log.getChild('io').debug(f"Querying currentduino firmware")
+            log.getChild('io').debug("Querying laserflipperduino firmware")
             response = self.query((7, 0), connect=True)
-            _, version = response.split(':')
+            _, version = response.split(b':')
             return float(version)
         except IOError as e:
             log.getChild('io').error(f"Serial error: {e}")
@@ -2627,12 +2809,11 @@ class Laserflipperduino(SerialDevice):
         elif not isinstance(index, int) or (index < 0) or (index > 4):
             raise ValueError('invalid laser index')
         else:
-            pwm_byte = int(value / 100 * 255)
-            message = (index, pwm_byte)
-            pin, val = self.query(message).split(':')
+            pwm_byte = self.PWM_LUT[value] if isinstance(value, int) else int(value / 100 * 255)
+            pin, val = self.query((index, pwm_byte)).split(b':')
             val = int(val) / 255 * 100
             self.status[int(pin)] = val  # Convert from 0-255 bit value to percentage
-            log.info(f"Pin {index} ({self.names[index]} laser) set to {val:.2f}%")
+            log.info("Pin %d (%s laser) set to %.2f%%", index, self.names[index], val)
 
     def set_mirror_position(self, position):
         """sett_mirror_position takes a position argument to move the mirror
@@ -2641,33 +2822,28 @@ class Laserflipperduino(SerialDevice):
         position should be a numerical value, 0 moved the flipper down and a
             non-zero value sets it to the up position
         """
-        if position.lower() == 'down':
-            log.debug(f"Setting mirror to down")
-            byte_val = 0
-        elif position.lower() == 'up':
-            log.debug(f"Setting mirror to up")
-            byte_val = 1
-        else:
+        position = position.lower()
+        byte_val = self.MIRROR_POSITIONS.get(position)
+        if byte_val is None:
             raise ValueError(f"Illegal mirror position requested: '{position}'. Legal values are ('down', 'up')")
-        pin, val = self.query((5, byte_val)).split(':')
+        log.debug("Setting mirror to %s", position)
+        pin, val = self.query((5, byte_val)).split(b':')
         self.status[int(pin)] = int(val)
         if int(val) == 0:
-            log.info(f"Mirror flipped down")
+            log.info("Mirror flipped down")
         else:
-            log.info(f"Mirror flipped up")
+            log.info("Mirror flipped up")
 
     def statuses(self):
         """get_status takes no arguments, prints the status of all 5 output
         pins"""
         log.getChild('io').debug("Reading laser and mirror statuses")
         statuses = {}
-        status_reply = self.query((6,0))
-        status_reply = status_reply.split(',')
-        for laser in status_reply:
-            dat = laser.split(':')
-            amp_value = float(dat[1]) / 255 * 100  # Convert to a percentage
-            self.status[int(dat[0])] = amp_value
-            statuses[self.names[int(dat[0])]] = amp_value
+        for pin, value in self.STATUS_RE.findall(self.query((6,0))):
+            pin = int(pin)
+            amp_value = float(value) / 255 * 100  # Convert to a percentage
+            self.status[pin] = amp_value
+            statuses[self.names[pin]] = amp_value
         return statuses
 
 
@@ -2683,14 +2859,21 @@ class Conex(SerialDevice):
                          "3C": "DISABLE from READY OL",
                          "3D": "DISABLE from MOVING CL",
                          "46": "JOGGING OL"}
+    READY_CODES = frozenset(("32", "33", "34", "35", "36"))
+    NO_ERR = "0000"
+    TIMEOUT_ERR = "0020"
 
     def __init__(self, port, controller=1, timeout=1, connect=True, initializer=None):
         super().__init__(name="Conex", port=port, baudrate=921600, timeout=timeout, bytesize=serial.EIGHTBITS,
                          stopbits=serial.STOPBITS_ONE, xonxoff=True, terminator='\r\n')
-        pass
 
         self.ctrlN = controller  # Controller can be an int between 1-31 inclusive or a string of 1 to 2 characters that
         # represents the possible number values (i.e. 1, "1", and "01" will all work)
+        self._ctrl_prefix_str = str(controller)
+        self._ctrl_prefix = self._ctrl_prefix_str.encode('utf-8')
+        self._terminator_bytes = self.terminator.encode('utf-8')
+        self._pau_prefix = self._ctrl_prefix + b"PAU"
+        self._pav_prefix = self._ctrl_prefix + b"PAV"
 
         self.u_lower_limit = -np.inf
         self.v_lower_limit = -np.inf
@@ -2704,7 +2887,7 @@ class Conex(SerialDevice):
 
         if connect:
             self.connect(raise_errors=False)
-            q = [float(self.query(q)) for q in ('SLU?', 'SLV?', 'SRU?', 'SRV?')]
+            q = [float(x) for x in self.query_many(('SLU?', 'SLV?', 'SRU?', 'SRV?'))]
             self.u_lower_limit = q[0]
             self.v_lower_limit = q[1]
             self.u_upper_limit = q[2]
@@ -2758,18 +2941,11 @@ class Conex(SerialDevice):
         :raises: IOError if there are communication issues
         """
         status_msg = self.query("TS?")
-        err = status_msg[:4]
-        status_code = status_msg[4:]
+        status_code = self._parse_status(status_msg)
 
-        if err == '0020':
-            raise IOError("Motion time out")
-        elif int(err, 16) > 0:
-            raise IOError(f"Unknown Err - {err}")
-
-        try:
-            status = self.CONTROLLER_STATES[status_code]
-        except (KeyError, ValueError) as e:
-            raise ValueError(f"Invalid status code read by conex: {e}")
+        status = self.CONTROLLER_STATES.get(status_code)
+        if status is None:
+            raise ValueError(f"Invalid status code read by conex: {status_code}")
 
         return (status_code, status, status_msg)
 
@@ -2783,20 +2959,23 @@ class Conex(SerialDevice):
         :raises
         IOError if there are communication issues
         """
-        # TODO: Just call self.status[0] to get the status_code?
-        # status = self.status()
-        # return int(status[0]) in (32, 33, 34, 35, 36)
+        return self._parse_status(self.query("TS?")) in self.READY_CODES
 
-        status_msg = self.query("TS?")
-        err = status_msg[:4]
-        status = status_msg[4:]
+    def _parse_status(self, status_msg):
+        """
+        Split a TS? response into its error and status code
 
-        if err == '0020':
+        :return: The status code
+        :raises: IOError if the conex reports an error
+        """
+        err = status_msg[:4]
+        if err == self.NO_ERR:
+            pass
+        elif err == self.TIMEOUT_ERR:
             raise IOError("Motion time out")
         elif int(err, 16) > 0:
             raise IOError(f"Unknown Err - {err}")
-
-        return int(status) in (32, 33, 34, 35, 36)
+        return status_msg[4:]
 
     def move(self, pos:(tuple, list, np.array), blocking=False, timeout=5.):
         """
@@ -2810,18 +2989,35 @@ class Conex(SerialDevice):
         with self._rlock:
             if not self.in_bounds(position=pos):
                 raise ValueError('Target position outside of limits. Aborted move')
-            self.send(f"PAU{pos[1]}")
-            self.ser.flush()  # wait until the write command finishes sending
-            self.send(f"PAV{pos[0]}")  # Conex can move both axes at once
+            self._move_raw(pos[1], pos[0])
             if blocking:
-                self.ser.flush()
+                self.ser.flush()  # wait until the write commands finish sending
         if blocking:
-            t = time.time()
-            while not self.ready():
-                if time.time() - t > timeout:
-                    status = self.status()
-                    raise IOError(f"Move timed out. Status: {status[1]} (code {status[0]})")
-                time.sleep(0.001)
+            self._wait_ready(timeout)
+
+    def _wait_ready(self, timeout):
+        """
+        Block until the conex reports ready, backing off from yielding to progressively longer sleeps between status
+        polls. A stop() puts the controller back in a ready state, so cancelling a move also ends the wait.
+
+        :raises: IOError if the conex is not ready within timeout seconds
+        """
+        t = time.time()
+        k = 0
+        while not self.ready():
+            if time.time() - t > timeout:
+                status = self.status()
+                raise IOError(f"Move timed out. Status: {status[1]} (code {status[0]})")
+            time.sleep(0 if k < 4 else 0.005 if k < 16 else 0.05)
+            k += 1
+
+    def _move_raw(self, u: float, v: float):
+        """
+        Send the PAU and PAV absolute move commands for both axes (Conex can move both at once) in a single write,
+        building the frames from prebuilt prefixes. Positions are sent with 3 decimal places, the Conex precision.
+        """
+        self.send(b"".join((self._pau_prefix, f"{u:.3f}".encode('utf-8'), self._terminator_bytes,
+                            self._pav_prefix, f"{v:.3f}".encode('utf-8'), self._terminator_bytes)))
 
     def home(self, blocking=False):
         """
@@ -2830,8 +3026,7 @@ class Conex(SerialDevice):
         self.move((0, 0), blocking=blocking)
 
     def position(self):
-        u_pos = self.query("TPU?")
-        v_pos = self.query("TPV?")
+        u_pos, v_pos = self.query_many(("TPU?", "TPV?"))
         return (float(v_pos), float(u_pos))
 
     def in_bounds(self, position:(tuple, list, np.array)=None, u:float=None, v:float=None):
@@ -2846,12 +3041,11 @@ class Conex(SerialDevice):
             if (u is None) or (v is None):
                 raise ValueError(f"Cannot determine position is in bounds without coordinates (either [u,v] or u and v)")
         else:
-            u = position[1]
-            v = position[0]
+            u, v = float(position[1]), float(position[0])
 
-        inbounds = ((self.u_lower_limit <= u <= self.u_upper_limit) and
-                    (self.v_lower_limit <= v <= self.v_upper_limit))
-        log.info(f"({u}, {v}) in bounds status is {inbounds}")
+        inbounds = self.u_lower_limit <= u <= self.u_upper_limit and self.v_lower_limit <= v <= self.v_upper_limit
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("(%s, %s) in bounds status is %s", u, v, inbounds)
         return inbounds
 
     def stop(self):
@@ -2897,13 +3091,32 @@ class Conex(SerialDevice):
         xx - Optional or required value or "?" to query current value
 
         If final characters of msg to not match self.terminator ('\r\n'), add the terminator
-        If initial character does not match controller number
+        If initial character(s) do not match controller number, add the controller number
         """
-        if msg and msg[-2:] != self.terminator:
-            msg = msg+self.terminator
-        if msg and ((msg[:1] != str(self.ctrlN)) or (msg[:2] != str(self.ctrlN))):
-            msg = str(self.ctrlN) + msg
-        return msg.encode('utf-8')
+        msg = msg.encode('utf-8') if isinstance(msg, str) else msg
+        if msg and not msg.endswith(self._terminator_bytes):
+            msg += self._terminator_bytes
+        if msg and not msg.startswith(self._ctrl_prefix):
+            msg = self._ctrl_prefix + msg
+        return msg
+
+    def receive(self):
+        """
+        Overrides method from base class
+        Reads a single reply, returning as soon as the '\r\n' terminator arrives rather than after a fixed delay. Raises
+        an IOError if the terminator is not seen before the serial timeout.
+        """
+        with self._rlock:
+            try:
+                data = self.ser.read_until(self.terminator.encode('utf-8'), size=256).decode("utf-8")
+                log.getChild('io').debug(f"Read {escapeString(data)} from {self.name}")
+                if not data.endswith(self.terminator):
+                    raise IOError("Got incomplete response. Consider increasing timeout.")
+                return data.strip()
+            except (IOError, serial.SerialException) as e:
+                self.disconnect()
+                log.getChild('io').debug(f"Receive failed {e}")
+                raise IOError(e)
 
     def query(self, cmd: str, **kwargs):
         """
@@ -2919,17 +3132,34 @@ class Conex(SerialDevice):
         with self._rlock:
             try:
                 self.send(cmd, **kwargs)
-                time.sleep(.1)
-                received = self.receive()
-                cmd = cmd.rstrip("?")
-                if (received[:1] == str(self.ctrlN)) or (received[:2] == str(self.ctrlN)):
-                    received = received.lstrip(str(self.ctrlN))
-                else:
-                    raise IOError(f"Received inaccurate message from Conex!")
-                if (received[:2] == cmd) or (received[:3] == cmd):
-                    received = received.lstrip(cmd)
-                else:
-                    raise IOError(f"Received inaccurate message from Conex!")
-                return received
+                return self._parse_reply(cmd, self.receive())
             except Exception as e:
-                raise IOError(e)
\ No newline at end of file
+                raise IOError(e)
+
+    def query_many(self, cmds: (list, tuple), **kwargs):
+        """
+        Send several commands back to back and then read their responses in order, kwargs passed to send, raises only
+        IOError. Saves waiting on a full round trip per command when several values are needed at once.
+
+        Returns a list of query responses in the same order as cmds
+        """
+        with self._rlock:
+            try:
+                for cmd in cmds:
+                    self.send(cmd, **kwargs)
+                self.ser.flush()
+                return [self._parse_reply(cmd, self.receive()) for cmd in cmds]
+            except Exception as e:
+                raise IOError(e)
+
+    def _parse_reply(self, cmd: str, received: str):
+        """
+        Checks that the response to cmd has the proper syntax and strips the controller number and command name
+        """
+        cmd = cmd.rstrip("?")
+        if not received.startswith(self._ctrl_prefix_str):
+            raise IOError(f"Received inaccurate message from Conex!")
+        received = received[len(self._ctrl_prefix_str):]
+        if not received.startswith(cmd):
+            raise IOError(f"Received inaccurate message from Conex!")
+        return received[len(cmd):]
\ No newline at end of file
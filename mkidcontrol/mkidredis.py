@@ -7,17 +7,23 @@ current, etc.).
 """
 
 from redis import Redis as _Redis
+from redis import ConnectionPool as _ConnectionPool
 from redis import RedisError, ConnectionError, TimeoutError, AuthenticationError, BusyLoadingError, \
     InvalidResponse, ResponseError, DataError, PubSubError, WatchError, \
     ReadOnlyError, ChildDeadlockedError, AuthenticationWrongNumberOfArgsError
 from redistimeseries.client import Client as _RTSClient
 import logging
+import socket
 from datetime import datetime
 import json
 # from .config import REDIS_DB
 
 REDIS_DB = 0
 
+# Start TCP keepalive probes on idle connections after a minute (where the platform supports tuning it). Note that
+# redis-py already sets TCP_NODELAY on every connection it opens.
+KEEPALIVE_OPTIONS = {socket.TCP_KEEPIDLE: 60} if hasattr(socket, 'TCP_KEEPIDLE') else {}
+
 
 class MKIDRedis:
     """
@@ -30,21 +36,22 @@ class MKIDRedis:
     explicitly and should be done at each program's start for clarity and ease.
     """
     def __init__(self, host='localhost', port=6379, db=REDIS_DB, ts_keys=tuple()):
-        self.redis = _Redis(host, port, db, socket_keepalive=True)
+        self.pool = _ConnectionPool(host=host, port=port, db=db, socket_keepalive=True,
+                                    socket_keepalive_options=KEEPALIVE_OPTIONS)
+        self.redis = _Redis(connection_pool=self.pool)
         self.redis_ts = None
         self._connect_ts()
 
-        self.ts_keys = ts_keys
+        self.ts_keys = frozenset(ts_keys)  # Checked on every read, so kept as a set
         self.create_ts_keys(ts_keys)
 
         self.ps = None  # Redis pubsub object. None until initialized, used for inter-program communication
 
     def _connect_ts(self, force=False):
-        """ Establish a redis time series client using the same connection info as for redis """
+        """ Establish a redis time series client sharing the persistent connection pool used for redis """
         if self.redis_ts is not None and not force:
             return
-        args = self.redis.connection_pool.connection_kwargs
-        self.redis_ts = _RTSClient(args['host'], args['port'], args['db'],  socket_keepalive=args['socket_keepalive'])
+        self.redis_ts = _RTSClient(connection_pool=self.pool)
 
     def create_ts_keys(self, keys):
         """
@@ -58,11 +65,15 @@ class MKIDRedis:
         if self.redis_ts is None and keys:
             self._connect_ts()
 
+        retention = keys if isinstance(keys, dict) else {}
         for k in keys:
+            kw = {'retention_msecs': retention[k]} if retention.get(k) else {}
             try:
-                self.redis_ts.create(k)
+                self.redis_ts.create(k, **kw)
             except ResponseError:
                 logging.getLogger(__name__).debug(f"Redistimeseries key '{k}' already exists.")
+                if kw:
+                    self.redis_ts.alter(k, **kw)
 
     def store(self, data, timeseries=False, encode_json=False):
         """
@@ -71,26 +82,39 @@ class MKIDRedis:
         If not storing timeseries keys, the value is published to the channel with the name of the key.
         :param data: Dict or iterable of key value pairs.
         :param timeseries: Bool
-        If True: uses redis_ts.add() and uses the automatic UNIX timestamp generation keyword (timestamp='*')
+        If True: uses redis_ts.add() for a single sample or one redis_ts.madd() for several, with the automatic UNIX
+        timestamp generation keyword (timestamp='*'). TS.MADD does not create missing keys, so any sample it rejects
+        is retried with redis_ts.add(), which creates the key (as a lone TS.ADD always has) or raises the error.
         If False: uses redis.set() and stores the keys normally
+        All of the commands for one call are sent in a single round trip (barring TS.MADD retries).
         :return: None
         """
         generator = data.items() if isinstance(data, dict) else iter(data)
         if timeseries:
             if self.redis_ts is None:
                 self._connect_ts()
+            samples = []
             for k, v in generator:
                 logging.getLogger(__name__).info(f"Setting ts {k} to {v}")
                 if encode_json:
                     v = json.dumps(v)
-                self.redis_ts.add(key=k, value=v, timestamp='*')
+                samples.append((k, '*', v))
+            if len(samples) == 1:
+                self.redis_ts.add(*samples[0])
+            elif samples:
+                # TS.MADD reports failures per sample instead of raising
+                for sample, result in zip(samples, self.redis_ts.madd(samples)):
+                    if isinstance(result, ResponseError):
+                        self.redis_ts.add(*sample)
         else:
+            pipe = self.redis.pipeline(transaction=False)
             for k, v in generator:
                 logging.getLogger(__name__).info(f"Setting {k} to {v}")
                 if encode_json:
                     v = json.dumps(v)
-                self.redis.set(k, v)
-                self.publish(k, v, store=False, encode_json=False)
+                pipe.set(k, v)
+                pipe.publish(k, v)
+            pipe.execute()
 
     def publish(self, channel, message, store=True, encode_json=False):
         """
@@ -205,6 +229,8 @@ class MKIDRedis:
     def listen(self, channels:(list, tuple, str), value_only=False, decode=None, timeout=None):
         """
         Sets up a subscription for the iterable keys, yielding decoded messages as (k,v) strings.
+        Blocks on the pubsub connection until a message arrives, there is no polling. If a timeout is given, waits
+        at most timeout seconds per read before checking the subscription again.
         Passes up any redis errors that are raised
         """
         log = logging.getLogger(__name__)
@@ -218,14 +244,14 @@ class MKIDRedis:
             raise e
 
         def listen_with_timeout(ps, timeout):
-            kw = dict(block=True) if timeout else dict(timeout=timeout)
+            kw = dict(block=False, timeout=timeout) if timeout else dict(block=True)
             while ps.subscribed:
                 response = ps.handle_message(ps.parse_response(**kw))
                 if response is not None:
                     yield response
 
         for msg in listen_with_timeout(ps, timeout):
-            log.debug(f"Pubsub received {msg}")
+            log.debug("Pubsub received %s", msg)
             if msg['type'] == 'subscribe':
                 continue
             key = msg['channel'].decode()